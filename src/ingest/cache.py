@@ -0,0 +1,80 @@
+import hashlib
+import json
+import sqlite3
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+
+class IngestCache:
+    """SQLite cache of chunk embeddings and KG extractions, keyed by chunk text.
+
+    Vectors and KGs live in separate tables with separate key namespaces:
+    ``vec_namespace`` describes the embedder (model, dtype, normalization) and
+    ``kg_namespace`` the extraction (model, prompts, sampling params). Changing one
+    never invalidates the other, and neither ever serves stale results.
+    """
+
+    def __init__(self, path: str | Path, vec_namespace: str = "", kg_namespace: str = ""):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.vec_namespace = vec_namespace.encode("utf-8")
+        self.kg_namespace = kg_namespace.encode("utf-8")
+        # written from the ingest stage thread, created on the caller's thread
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS vecs (hash BLOB PRIMARY KEY, vec BLOB NOT NULL)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS kgs (hash BLOB PRIMARY KEY, kg TEXT NOT NULL)")
+        self.conn.commit()
+
+    @staticmethod
+    def _key(namespace: bytes, text: str) -> bytes:
+        h = hashlib.blake2b(namespace, digest_size=16)
+        h.update(b"\0")
+        h.update(text.encode("utf-8"))
+        return h.digest()
+
+    def vec_key(self, text: str) -> bytes:
+        return self._key(self.vec_namespace, text)
+
+    def kg_key(self, text: str) -> bytes:
+        return self._key(self.kg_namespace, text)
+
+    def _get_many(self, table: str, column: str, keys: List[bytes]) -> Dict[bytes, Any]:
+        if not keys:
+            return {}
+        marks = ",".join("?" * len(keys))
+        return dict(
+            self.conn.execute(f"SELECT hash, {column} FROM {table} WHERE hash IN ({marks})", keys).fetchall()
+        )
+
+    def get_vecs(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        return {
+            h: np.frombuffer(vec, dtype=np.float16).astype(np.float32)
+            for h, vec in self._get_many("vecs", "vec", keys).items()
+        }
+
+    def get_kgs(self, keys: List[bytes]) -> Dict[bytes, Dict[str, Any]]:
+        return {h: json.loads(kg) for h, kg in self._get_many("kgs", "kg", keys).items()}
+
+    def put_vecs(self, items: List[Tuple[bytes, np.ndarray]]) -> None:
+        if not items:
+            return
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO vecs (hash, vec) VALUES (?, ?)",
+            [(h, np.asarray(vec, dtype=np.float16).tobytes()) for h, vec in items],
+        )
+        self.conn.commit()
+
+    def put_kgs(self, items: List[Tuple[bytes, Dict[str, Any]]]) -> None:
+        if not items:
+            return
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO kgs (hash, kg) VALUES (?, ?)",
+            [(h, json.dumps(kg, ensure_ascii=False)) for h, kg in items],
+        )
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
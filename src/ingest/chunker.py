@@ -1,62 +1,67 @@
-import re, hashlib, json
-from dataclasses import dataclass, asdict
+import re, hashlib
+import orjson
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
 from typing import List, Iterable, Optional, Tuple
 
-H_RE       = re.compile(r"^(#{1,6})\s+(.*)$", re.MULTILINE)
-TITLE_RE   = re.compile(r"^#\s+(.*)$", re.MULTILINE)
-SOURCE_RE  = re.compile(r"^>\s*Source:\s*(\S+)", re.IGNORECASE | re.MULTILINE)
+H_RE       = re.compile(r"^(#{1,6})[^\S\r\n]+(.*)$", re.MULTILINE)
+# title (first H1) and "> Source: <url>" share one pattern so a single sweep finds both
+META_RE    = re.compile(
+    r"^(?:#[^\S\r\n]+(.*)$|>[^\S\r\n]*Source:[^\S\r\n]*(\S+))", re.IGNORECASE | re.MULTILINE
+)
 
 def _hash_id(*parts: str, n: int = 16) -> str:
-    return hashlib.sha1("::".join(parts).encode("utf-8")).hexdigest()[:n]
+    return hashlib.blake2b("::".join(parts).encode("utf-8"), digest_size=(n + 1) // 2).hexdigest()[:n]
 
 def _title_url(md: str) -> Tuple[Optional[str], Optional[str]]:
-    t = TITLE_RE.search(md)
-    s = SOURCE_RE.search(md)
-    return (t.group(1).strip() if t else None, s.group(1).strip() if s else None)
+    title: Optional[str] = None
+    url: Optional[str] = None
+    for m in META_RE.finditer(md):
+        if m.group(1) is not None:
+            if title is None:
+                title = m.group(1).strip()
+        elif url is None:
+            url = m.group(2).strip()
+        if title is not None and url is not None:
+            break
+    return title, url
 
 def _split_sections(md: str) -> List[Tuple[str, str]]:
     sections: List[Tuple[str, str]] = []
-    lines = md.splitlines()
     path: List[str] = []
-    buf: List[str] = []
-
-    def flush():
-        if buf:
-            sections.append(
-                (
-                    " > ".join([p for p in path if p]) or "(root)",
-                    "\n".join(buf).strip() + "\n",
-                )
-            )
 
-    for ln in lines:
-        m = H_RE.match(ln)
-        if m:
-            # new heading → finish previous section
-            flush()
-            level = len(m.group(1))
-            text  = m.group(2).strip()
-            path  = path[:level-1] + [text]
-            buf   = [ln]  # include heading itself
-        else:
-            buf.append(ln)
-    flush()
+    # one regex sweep over the whole buffer; section bodies are sliced by offset
+    matches = list(H_RE.finditer(md))
+    first = matches[0].start() if matches else len(md)
+    if first:
+        sections.append(("(root)", md[:first].strip() + "\n"))
+
+    for i, m in enumerate(matches):
+        level = len(m.group(1))
+        text  = m.group(2).strip()
+        path  = path[:level-1] + [text]
+        end   = matches[i + 1].start() if i + 1 < len(matches) else len(md)
+        # section includes the heading itself
+        sections.append(
+            (
+                " > ".join([p for p in path if p]) or "(root)",
+                md[m.start():end].strip() + "\n",
+            )
+        )
     return sections
 
 def _char_windows(s: str, size: int, overlap: int) -> List[Tuple[int, int]]:
     assert size > 0 and 0 <= overlap < size
-    out: List[Tuple[int, int]] = []
-    i, n = 0, len(s)
-    while i < n:
-        j = min(i + size, n)
-        out.append((i, j))
-        if j >= n:
-            break
-        i = max(j - overlap, i + 1)
-    return out
+    n = len(s)
+    if not n:
+        return []
+    # starts step by (size - overlap) until a window reaches the end of s
+    return [(i, min(i + size, n)) for i in range(0, max(n - overlap, 1), size - overlap)]
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Chunk:
     chunk_id: str
     doc_id: str
@@ -67,12 +72,21 @@ class Chunk:
 
 class SectionChunker:
 
-    def __init__(self, chunk_chars: int = 800, overlap_chars: int = 120, max_header_level: int = 6):
+    def __init__(
+        self,
+        chunk_chars: int = 800,
+        overlap_chars: int = 120,
+        max_header_level: int = 6,
+        workers: int = 1,
+    ):
         assert 1 <= max_header_level <= 6
         assert 0 <= overlap_chars < chunk_chars
         self.size = int(chunk_chars)
         self.over = int(overlap_chars)
         self.max_h = max_header_level
+        # regex chunking is ~1s per 40k chunks in-process; a pool only pays off on very
+        # large corpora, and every spawned worker re-imports the caller's __main__
+        self.workers = max(1, int(workers))
 
     def chunk_markdown_text(self, md_text: str, source_file: str) -> List[Chunk]:
         # we still compute doc_id from URL or source_file for grouping
@@ -86,7 +100,9 @@ class SectionChunker:
         idx = 0
         for sec_path, sec_text in sections:
             for (ws, we) in _char_windows(sec_text, self.size, self.over):
-                piece = sec_text[ws:we].strip()
+                piece = sec_text[ws:we]
+                if piece[:1].isspace() or piece[-1:].isspace():
+                    piece = piece.strip()
                 if not piece:
                     continue
                 chunk_id = _hash_id(doc_id, sec_path, str(idx))
@@ -102,20 +118,43 @@ class SectionChunker:
                 idx += 1
         return chunks
 
+    def _chunk_file(self, path: Path, rel: str) -> List[Chunk]:
+        md_text = path.read_text(encoding="utf-8", errors="ignore")
+        return self.chunk_markdown_text(md_text, rel)
+
     def chunk_dir(self, root: Path) -> Iterable[Chunk]:
         root = Path(root)
-        for p in sorted(root.rglob("*.md")):
-            if "/assets/" in p.as_posix():
-                continue
-            md_text = p.read_text(encoding="utf-8", errors="ignore")
-            rel = str(p.relative_to(root))
-            for ch in self.chunk_markdown_text(md_text, rel):
-                yield ch
+        paths = [p for p in sorted(root.rglob("*.md")) if "/assets/" not in p.as_posix()]
+        rels = [str(p.relative_to(root)) for p in paths]
+
+        if self.workers == 1 or len(paths) <= 1:
+            for p, rel in zip(paths, rels):
+                yield from self._chunk_file(p, rel)
+            return
+
+        # spawn, not fork: callers may already hold threads or a CUDA context
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx) as executor:
+            # bounded window: a file is only submitted once an earlier one is consumed,
+            # so a slow consumer never has the whole corpus chunked in memory
+            todo = iter(zip(paths, rels))
+            window = deque()
+            for p, rel in todo:
+                window.append(executor.submit(self._chunk_file, p, rel))
+                if len(window) >= 2 * self.workers:
+                    break
+            while window:
+                chunks = window.popleft().result()
+                for p, rel in todo:
+                    window.append(executor.submit(self._chunk_file, p, rel))
+                    break
+                yield from chunks
 
     @staticmethod
     def write_jsonl(chunks: Iterable[Chunk], out_path: str | Path) -> None:
         out = Path(out_path)
         out.parent.mkdir(parents=True, exist_ok=True)
-        with out.open("w", encoding="utf-8") as f:
+        with out.open("wb") as f:
             for ch in chunks:
-                f.write(json.dumps(asdict(ch), ensure_ascii=False) + "\n")
+                # orjson encodes dataclasses natively, no asdict() copy per chunk
+                f.write(orjson.dumps(ch) + b"\n")
@@ -5,58 +5,93 @@ import json
 
 NEO4J_URI = os.getenv("NEO4J_URI", "bolt://localhost:7687")
 NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
-NEO4J_PASS = os.getenv("NEO4J_PASS", None)  
+NEO4J_PASS = os.getenv("NEO4J_PASS", None)
 
 driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASS))
 
-def upsert_entities(tx, entities, source_file, section_path, doc_id):
+
+def entity_rows(
+    entities: List[Dict[str, Any]],
+    source_file: Optional[str],
+    section_path: Optional[str],
+    doc_id: Optional[str],
+) -> List[Dict[str, Any]]:
+    # per-chunk provenance is the same for every entity → build the lists once
+    sf_add = [source_file] if source_file is not None else []
+    sp_add = [section_path] if section_path is not None else []
+    di_add = [doc_id] if doc_id is not None else []
+
+    rows = []
     for ent in entities:
+        # MERGE on a null id fails the whole transaction
+        if not isinstance(ent, dict) or not ent.get("id"):
+            continue
         extra_dict = ent.get("extra") or {}
-        extra_json = json.dumps(extra_dict, ensure_ascii=False)
-
-        tx.run(
-            """
-            MERGE (e:DocEntity {id: $id})
-            SET e.name        = $name,
-                e.type        = $type,
-                e.description = $description,
-                e.extra       = $extra_json,
-                e.source_files  = coalesce(e.source_files, []) +
-                                  CASE WHEN $source_file IS NULL THEN [] ELSE [$source_file] END,
-                e.section_paths = coalesce(e.section_paths, []) +
-                                  CASE WHEN $section_path IS NULL THEN [] ELSE [$section_path] END,
-                e.doc_ids       = coalesce(e.doc_ids, []) +
-                                  CASE WHEN $doc_id IS NULL THEN [] ELSE [$doc_id] END
-            """,
-            id=ent.get("id"),
-            name=ent.get("name"),
-            type=ent.get("type"),
-            description=ent.get("description", ""),
-            extra_json=extra_json,
-            source_file=source_file,
-            section_path=section_path,
-            doc_id=doc_id,
+        extra_json = json.dumps(extra_dict, ensure_ascii=False) if extra_dict else "{}"
+        rows.append(
+            {
+                "id": ent.get("id"),
+                "name": ent.get("name"),
+                "type": ent.get("type"),
+                "description": ent.get("description", ""),
+                "extra_json": extra_json,
+                "source_files_add": sf_add,
+                "section_paths_add": sp_add,
+                "doc_ids_add": di_add,
+            }
         )
+    return rows
 
 
-def upsert_relations(
-    tx,
+def relation_rows(
     relations: List[Dict[str, Any]],
-    source_file: str,
-):
+    source_file: Optional[str],
+) -> List[Dict[str, Any]]:
+    sf_add = [source_file] if source_file is not None else []
+
+    rows = []
     for rel in relations:
-        tx.run(
-            """
-            MERGE (s:DocEntity {id: $subject})
-            MERGE (o:DocEntity {id: $object})
-            MERGE (s)-[r:DOC_REL {predicate: $predicate}]->(o)
-            SET r.description  = $description,
-                r.source_files = coalesce(r.source_files, []) +
-                                 CASE WHEN $source_file IS NULL THEN [] ELSE [$source_file] END
-            """,
-            subject=rel.get("subject"),
-            predicate=rel.get("predicate"),
-            object=rel.get("object"),
-            description=rel.get("description", ""),
-            source_file=source_file,
+        # MERGE on a null subject/object/predicate fails the whole UNWIND batch
+        if not isinstance(rel, dict) or not rel.get("subject") or not rel.get("object") or not rel.get("predicate"):
+            continue
+        rows.append(
+            {
+                "subject": rel.get("subject"),
+                "predicate": rel.get("predicate"),
+                "object": rel.get("object"),
+                "description": rel.get("description", ""),
+                "source_files_add": sf_add,
+            }
         )
+    return rows
+
+
+def upsert_entities(tx, rows: List[Dict[str, Any]]):
+    tx.run(
+        """
+        UNWIND $rows AS row
+        MERGE (e:DocEntity {id: row.id})
+        SET e.name        = row.name,
+            e.type        = row.type,
+            e.description = row.description,
+            e.extra       = row.extra_json,
+            e.source_files  = coalesce(e.source_files, []) + row.source_files_add,
+            e.section_paths = coalesce(e.section_paths, []) + row.section_paths_add,
+            e.doc_ids       = coalesce(e.doc_ids, []) + row.doc_ids_add
+        """,
+        rows=rows,
+    )
+
+
+def upsert_relations(tx, rows: List[Dict[str, Any]]):
+    tx.run(
+        """
+        UNWIND $rows AS row
+        MERGE (s:DocEntity {id: row.subject})
+        MERGE (o:DocEntity {id: row.object})
+        MERGE (s)-[r:DOC_REL {predicate: row.predicate}]->(o)
+        SET r.description  = row.description,
+            r.source_files = coalesce(r.source_files, []) + row.source_files_add
+        """,
+        rows=rows,
+    )
@@ -1,10 +1,24 @@
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from typing import Any, Dict, List
 from models.text_embedding import TextEmbedding  
 from ingest.chunker import Chunk
 
 OPENSEARCH_URL = "http://localhost:9200"
 DOC_CHUNKS_INDEX = "doc_chunks"
 DOC_IMAGE_INDEX = "doc_images"
+BULK_BATCH_SIZE = 500
+
+# one pooled keep-alive session for every OpenSearch call in this module
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=16, pool_maxsize=64, max_retries=3)
+_session.mount("http://", _adapter)
+_session.mount("https://", _adapter)
+_session.headers.update({"Content-Type": "application/json"})
+
+# embedders hand back numpy vectors; orjson writes them directly, no .tolist()
+_ORJSON_OPTS = orjson.OPT_SERIALIZE_NUMPY
 
 
 def get_embedding_dim(embedder: TextEmbedding) -> int:
@@ -42,19 +56,17 @@ def create_index(embedder: TextEmbedding) -> None:
         },
     }
 
-    requests.delete(f"{OPENSEARCH_URL}/{DOC_CHUNKS_INDEX}")
+    _session.delete(f"{OPENSEARCH_URL}/{DOC_CHUNKS_INDEX}")
 
-    resp = requests.put(
+    resp = _session.put(
         f"{OPENSEARCH_URL}/{DOC_CHUNKS_INDEX}",
         json=mapping,
-        headers={"Content-Type": "application/json"},
     )
     resp.raise_for_status()
 
 
-def index_chunk(chunk: Chunk, entity_ids, embedder: TextEmbedding) -> None:
-    vec = embedder.embed([chunk.text])[0]
-    doc = {
+def build_doc(chunk: Chunk, entity_ids, vec) -> Dict[str, Any]:
+    return {
         "chunk_id":     chunk.chunk_id,
         "doc_id":       chunk.doc_id,
         "source_file":  chunk.source_file,
@@ -64,9 +76,53 @@ def index_chunk(chunk: Chunk, entity_ids, embedder: TextEmbedding) -> None:
         "vector":       vec,
     }
 
-    resp = requests.post(
-        f"{OPENSEARCH_URL}/{DOC_CHUNKS_INDEX}/_doc/{chunk.chunk_id}",
-        json=doc,
-        headers={"Content-Type": "application/json"},
+
+def post_doc(doc: Dict[str, Any]) -> None:
+    resp = _session.post(
+        f"{OPENSEARCH_URL}/{DOC_CHUNKS_INDEX}/_doc/{doc['chunk_id']}",
+        data=orjson.dumps(doc, option=_ORJSON_OPTS),
+    )
+    resp.raise_for_status()
+
+
+def bulk_index(index: str, docs: List[Dict[str, Any]], id_field: str) -> None:
+    if not docs:
+        return
+
+    lines = []
+    for doc in docs:
+        lines.append(orjson.dumps({"index": {"_index": index, "_id": doc[id_field]}}))
+        lines.append(orjson.dumps(doc, option=_ORJSON_OPTS))
+    payload = b"\n".join(lines) + b"\n"
+
+    resp = _session.post(
+        f"{OPENSEARCH_URL}/_bulk",
+        data=payload,
+        headers={"Content-Type": "application/x-ndjson"},
     )
     resp.raise_for_status()
+
+    # _bulk answers 200 even when individual items fail
+    data = orjson.loads(resp.content)
+    if data.get("errors"):
+        failed = [
+            item for item in data.get("items", [])
+            if next(iter(item.values())).get("error")
+        ]
+        first = next(iter(failed[0].values())) if failed else {}
+        raise RuntimeError(
+            f"Bulk indexing into {index} failed for {len(failed)} docs: {first.get('error')}"
+        )
+
+
+def bulk_index_chunks(docs: List[Dict[str, Any]]) -> None:
+    bulk_index(DOC_CHUNKS_INDEX, docs, id_field="chunk_id")
+
+
+def index_chunk_with_vec(chunk: Chunk, entity_ids, vec) -> None:
+    post_doc(build_doc(chunk, entity_ids, vec))
+
+
+def index_chunk(chunk: Chunk, entity_ids, embedder: TextEmbedding) -> None:
+    vec = embedder.embed([chunk.text])[0]
+    index_chunk_with_vec(chunk, entity_ids, vec)
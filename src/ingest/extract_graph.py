@@ -1,14 +1,18 @@
+import asyncio
+import hashlib
 import json
 import os
-from typing import Dict, Any
+import threading
+from concurrent.futures import Future
+from typing import Dict, Any, List, Optional
 
-from openai import OpenAI
+from openai import AsyncOpenAI
 
 OPENAI_BASE_URL = "http://localhost:8000/v1"
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "dummy")
 OPENAI_MODEL_NAME = "Qwen/Qwen2.5-Coder-7B-Instruct-AWQ"
 
-client = OpenAI(
+client = AsyncOpenAI(
     base_url=OPENAI_BASE_URL,  
     api_key=OPENAI_API_KEY,
 )
@@ -106,6 +110,15 @@ Text:
 {chunk_text}
 ```"""
 
+TEMPERATURE = 0.1
+MAX_TOKENS = 512
+
+# fingerprint of everything that shapes an extraction; cached KGs are keyed on it
+KG_SIGNATURE = hashlib.blake2b(
+    json.dumps([OPENAI_MODEL_NAME, SYSTEM_PROMPT, USER_PROMPT_TEMPLATE, TEMPERATURE, MAX_TOKENS]).encode("utf-8"),
+    digest_size=8,
+).hexdigest()
+
 
 # -----------------------------------------------------------------------------------
 
@@ -119,17 +132,17 @@ def _extract_json_block(text: str) -> str:
 
 
 
-def extract_kg_from_chunk(chunk_text: str) -> Dict[str, Any]:
+async def extract_kg_from_chunk(chunk_text: str) -> Dict[str, Any]:
     user_prompt = USER_PROMPT_TEMPLATE.format(chunk_text=chunk_text)
 
-    completion = client.chat.completions.create(
+    completion = await client.chat.completions.create(
         model=OPENAI_MODEL_NAME,
         messages=[
             {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": user_prompt},
         ],
-        temperature=0.1,
-        max_tokens=512,
+        temperature=TEMPERATURE,
+        max_tokens=MAX_TOKENS,
     )
 
     content = completion.choices[0].message.content.strip()
@@ -151,3 +164,42 @@ def extract_kg_from_chunk(chunk_text: str) -> Dict[str, Any]:
         relations = []
 
     return {"entities": entities, "relations": relations}
+
+
+async def extract_kg_batch(chunk_texts: List[str], concurrency: int = 32) -> List[Optional[Dict[str, Any]]]:
+    """One KG dict per text, in input order; ``None`` where the request itself failed."""
+    sem = asyncio.Semaphore(max(1, concurrency))
+    results: List[Optional[Dict[str, Any]]] = [None] * len(chunk_texts)
+
+    async def _one(idx: int) -> None:
+        async with sem:
+            try:
+                results[idx] = await extract_kg_from_chunk(chunk_texts[idx])
+            except Exception:
+                results[idx] = None
+
+    # when concurrency < len(chunk_texts), dispatch longest prompts first so the
+    # slowest ones are not left trailing at the end of the batch
+    order = sorted(range(len(chunk_texts)), key=lambda i: len(chunk_texts[i]), reverse=True)
+    await asyncio.gather(*(_one(i) for i in order))
+    return results
+
+
+# The async client keeps its connection pool on one event loop, so every batch
+# runs on the same long-lived loop in a background thread.
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="kg-extract", daemon=True).start()
+    return _loop
+
+
+def submit_kg_batch(chunk_texts: List[str], concurrency: int = 32) -> Future:
+    """Start extraction for a batch without blocking; ``.result()`` is ``extract_kg_batch``'s list."""
+    return asyncio.run_coroutine_threadsafe(extract_kg_batch(chunk_texts, concurrency), _get_loop())
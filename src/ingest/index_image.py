@@ -1,12 +1,22 @@
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
 from PIL import Image
-from typing import List
+from typing import Any, Dict, List
 
 from models.image_embedding import ImageEmbedder
+from ingest.create_index import bulk_index
 
 OPENSEARCH_URL = "http://localhost:9200"
 DOC_IMAGES_INDEX = "doc_images"
 
+# one pooled keep-alive session for every OpenSearch call in this module
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=16, pool_maxsize=64, max_retries=3)
+_session.mount("http://", _adapter)
+_session.mount("https://", _adapter)
+_session.headers.update({"Content-Type": "application/json"})
+
 def get_image_embedding_dim(embedder: ImageEmbedder) -> int:
     dummy = Image.new("RGB", (32, 32), color=0)
     vec = embedder.embed_images([dummy])[0]
@@ -40,26 +50,32 @@ def create_image_index(embedder: ImageEmbedder) -> None:
         },
     }
 
-    requests.delete(f"{OPENSEARCH_URL}/{DOC_IMAGES_INDEX}")
+    _session.delete(f"{OPENSEARCH_URL}/{DOC_IMAGES_INDEX}")
 
-    resp = requests.put(
+    resp = _session.put(
         f"{OPENSEARCH_URL}/{DOC_IMAGES_INDEX}",
         json=mapping,
-        headers={"Content-Type": "application/json"},
     )
     resp.raise_for_status()
 
 
-def index_image(image_id: str, path: str, vector: List[float], doc_id: str = ""):
-    doc = {
+def build_image_doc(image_id: str, path: str, vector: List[float], doc_id: str = "") -> Dict[str, Any]:
+    return {
         "image_id": image_id,
         "path": path,
         "vector": vector,
     }
 
-    resp = requests.post(
+
+def bulk_index_images(docs: List[Dict[str, Any]]) -> None:
+    bulk_index(DOC_IMAGES_INDEX, docs, id_field="image_id")
+
+
+def index_image(image_id: str, path: str, vector: List[float], doc_id: str = ""):
+    doc = build_image_doc(image_id, path, np.asarray(vector, dtype=np.float32).tolist(), doc_id)
+
+    resp = _session.post(
         f"{OPENSEARCH_URL}/{DOC_IMAGES_INDEX}/_doc/{image_id}",
         json=doc,
-        headers={"Content-Type": "application/json"},
     )
     resp.raise_for_status()
@@ -1,18 +1,28 @@
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
 from itertools import islice
-from typing import Iterable, List, TypeVar, Dict, Any
+from queue import Queue
+from threading import Thread
+from typing import Iterable, Iterator, List, Optional, Tuple, TypeVar, Dict, Any
 from tqdm import tqdm
 import hashlib
+import numpy as np
 from PIL import Image
 
 from models.text_embedding import TextEmbedding
 from models.image_embedding import ImageEmbedder, ImageEmbedderConfig
 from ingest.chunker import Chunk, SectionChunker
-from ingest.extract_graph import extract_kg_from_chunk
-from ingest.create_graph import driver, upsert_entities, upsert_relations
-from ingest.create_index import create_index, index_chunk
-from ingest.index_image import create_image_index, index_image
+from ingest.cache import IngestCache
+from ingest.extract_graph import KG_SIGNATURE, submit_kg_batch
+from ingest.create_graph import (
+    driver,
+    entity_rows,
+    relation_rows,
+    upsert_entities,
+    upsert_relations,
+)
+from ingest.create_index import BULK_BATCH_SIZE, create_index, build_doc, bulk_index_chunks
+from ingest.index_image import create_image_index, build_image_doc, bulk_index_images
 
 
 T = TypeVar("T")
@@ -26,6 +36,113 @@ def batched(iterable: Iterable[T], n: int) -> Iterable[List[T]]:
             return
         yield batch
 
+
+def prefetch(iterable: Iterable[T], maxsize: int) -> Iterator[T]:
+    """Drain ``iterable`` on a background thread, keeping at most ``maxsize`` items buffered."""
+    q: Queue = Queue(maxsize=max(1, maxsize))
+
+    def _produce():
+        try:
+            for item in iterable:
+                q.put((True, item))
+        except Exception as exc:
+            q.put((False, exc))
+        else:
+            q.put((False, None))
+
+    Thread(target=_produce, daemon=True).start()
+    while True:
+        ok, item = q.get()
+        if not ok:
+            if item is not None:
+                raise item
+            return
+        yield item
+
+def dedup_chunks(chunks: Iterable[Chunk]) -> Iterator[Chunk]:
+    """Drop chunks whose text was already seen, before any embedding / LLM work."""
+    seen: set[bytes] = set()
+    for chunk in chunks:
+        h = hashlib.blake2b(chunk.text.encode("utf-8"), digest_size=16).digest()
+        if h in seen:
+            continue
+        seen.add(h)
+        yield chunk
+
+def _load_image(p: Path, draft_size: Tuple[int, int] = (224, 224)) -> Optional[Image.Image]:
+    try:
+        img = Image.open(p)
+        # JPEGs: let libjpeg decode straight at (no less than) CLIP's input resolution
+        img.draft("RGB", draft_size)
+        return img.convert("RGB")
+    except Exception:
+        return None
+
+def _embed_batches(
+    batches: Iterable[List[Chunk]],
+    embedder: TextEmbedding,
+    extract_concurrency: Optional[int] = None,
+    cache: Optional[IngestCache] = None,
+) -> Iterator[Tuple[List[Chunk], List[np.ndarray], Optional[List[Optional[Dict[str, Any]]]]]]:
+    """Stage 2 of text ingestion: embed each batch, extracting KGs concurrently if asked.
+
+    Vectors / KGs already in ``cache`` are reused; only the misses hit the models.
+    """
+    for chunk_batch in batches:
+        texts = [chunk.text for chunk in chunk_batch]
+        vecs: List[Optional[np.ndarray]] = [None] * len(texts)
+        kgs: List[Optional[Dict[str, Any]]] = [None] * len(texts)
+        if cache is not None:
+            vec_keys = [cache.vec_key(t) for t in texts]
+            cached_vecs = cache.get_vecs(vec_keys)
+            vecs = [cached_vecs.get(k) for k in vec_keys]
+            if extract_concurrency:
+                kg_keys = [cache.kg_key(t) for t in texts]
+                cached_kgs = cache.get_kgs(kg_keys)
+                kgs = [cached_kgs.get(k) for k in kg_keys]
+
+        kg_todo = [i for i, kg in enumerate(kgs) if kg is None] if extract_concurrency else []
+        vec_todo = [i for i, vec in enumerate(vecs) if vec is None]
+
+        kg_future = (
+            submit_kg_batch([texts[i] for i in kg_todo], concurrency=extract_concurrency)
+            if kg_todo else None
+        )
+        # embed the same batch on this thread while the LLM calls are in flight
+        if vec_todo:
+            for i, vec in zip(vec_todo, embedder.embed([texts[i] for i in vec_todo])):
+                vecs[i] = vec
+        if kg_future is not None:
+            for i, kg in zip(kg_todo, kg_future.result()):
+                kgs[i] = kg
+
+        if cache is not None:
+            cache.put_vecs([(vec_keys[i], vecs[i]) for i in vec_todo])
+            # failed extractions (None) are retried on the next run
+            cache.put_kgs([(kg_keys[i], kgs[i]) for i in kg_todo if kgs[i] is not None])
+
+        yield chunk_batch, vecs, (kgs if extract_concurrency else None)
+
+def _decode_images(
+    path_batches: Iterable[List[Path]],
+    decoder: ThreadPoolExecutor,
+) -> Iterator[Tuple[List[Path], List[Path], List[Image.Image]]]:
+    """Stage 1 of image ingestion: decode each batch on the thread pool."""
+    for path_batch in path_batches:
+        # PIL releases the GIL while decoding, so threads decode in parallel
+        loaded = list(decoder.map(_load_image, path_batch))
+        valid = [(p, img) for p, img in zip(path_batch, loaded) if img is not None]
+        yield path_batch, [p for p, _ in valid], [img for _, img in valid]
+
+def _embed_images(
+    decoded: Iterable[Tuple[List[Path], List[Path], List[Image.Image]]],
+    img_embedder: ImageEmbedder,
+) -> Iterator[Tuple[List[Path], List[Path], Optional[np.ndarray]]]:
+    """Stage 2 of image ingestion: CLIP-embed each decoded batch."""
+    for path_batch, valid_paths, pil_images in decoded:
+        vecs = img_embedder.embed_images(pil_images) if pil_images else None
+        yield path_batch, valid_paths, vecs
+
 def _find_image_files(assets_root: Path) -> List[Path]:
     exts = {".png", ".jpg", ".jpeg", ".webp", ".bmp"}
     return [
@@ -35,34 +152,65 @@ def _find_image_files(assets_root: Path) -> List[Path]:
     ]
 
 
-def ingest_docs(root_dir: str, enable_graph: bool = False, batch_size: int = 32):
+def ingest_docs(
+    root_dir: str,
+    enable_graph: bool = False,
+    batch_size: int = 32,
+    embed_batch_size: int = 64,
+    bulk_size: int = BULK_BATCH_SIZE,
+    chunk_workers: int = 1,
+    extract_concurrency: Optional[int] = None,
+    cache_path: Optional[str] = ".cache/ingest.sqlite",
+):
 
-    chunker = SectionChunker(chunk_chars=2500, overlap_chars=200)
+    chunker = SectionChunker(chunk_chars=2500, overlap_chars=200, workers=chunk_workers)
 
     embedder = TextEmbedding()
     create_index(embedder)
 
     root_path = Path(root_dir)
-
-    # Materialize chunks so tqdm can display total
-    chunks: List[Chunk] = list(chunker.chunk_dir(root_path))
-    total_chunks = len(chunks)
-
-    if total_chunks == 0:
-        print("No chunks found, nothing to ingest.")
-        return
+    bulk_size = max(1, bulk_size)
+
+    # re-runs skip embedding / extraction for chunk texts seen before; vectors are keyed
+    # on the embedder settings and KGs on the extraction signature, independently
+    vec_namespace = "|".join([
+        embedder.cfg.model_id,
+        str(embedder.dtype),
+        f"normalize={embedder.cfg.normalize}",
+    ])
+    cache = (
+        IngestCache(cache_path, vec_namespace=vec_namespace, kg_namespace=KG_SIGNATURE)
+        if cache_path else None
+    )
 
     if not enable_graph:
         print("Graph disabled → running plain vector RAG ingestion.")
+        embed_batch_size = max(1, embed_batch_size)
+        # chunk → embed → index run as overlapping stages joined by bounded queues;
+        # chunk_dir itself only runs ahead by a few files, so apart from the dedup
+        # digests only a few batches are ever held in memory
+        chunks = prefetch(dedup_chunks(chunker.chunk_dir(root_path)), maxsize=4 * embed_batch_size)
+        embedded = prefetch(
+            _embed_batches(batched(chunks, embed_batch_size), embedder, cache=cache),
+            maxsize=2,
+        )
+        docs: List[Dict[str, Any]] = []
         with tqdm(
-            total=total_chunks,
             desc="Indexing chunks (no graph)",
             unit="chunk",
         ) as pbar:
-            for chunk in chunks:
-                entity_ids: List[str] = []
-                index_chunk(chunk, entity_ids, embedder)
-                pbar.update(1)
+            for chunk_batch, vecs, _ in embedded:
+                for chunk, vec in zip(chunk_batch, vecs):
+                    docs.append(build_doc(chunk, [], vec))
+                if len(docs) >= bulk_size:
+                    bulk_index_chunks(docs)
+                    docs = []
+                pbar.update(len(chunk_batch))
+            bulk_index_chunks(docs)
+        if cache is not None:
+            cache.close()
+        if pbar.n == 0:
+            print("No chunks found, nothing to ingest.")
         return
 
     effective_batch_size = max(1, batch_size)
@@ -71,60 +219,68 @@ def ingest_docs(root_dir: str, enable_graph: bool = False, batch_size: int = 32)
         f"(batch_size={effective_batch_size})."
     )
 
-    with driver.session() as session, ThreadPoolExecutor(
-        max_workers=effective_batch_size
-    ) as executor:
+    chunks = prefetch(dedup_chunks(chunker.chunk_dir(root_path)), maxsize=4 * effective_batch_size)
+    embedded = prefetch(
+        _embed_batches(
+            batched(chunks, effective_batch_size),
+            embedder,
+            # one batch extracts at a time, so this is the total in-flight load on vLLM;
+            # default to the whole batch so its continuous batching stays fed
+            extract_concurrency=max(1, extract_concurrency or effective_batch_size),
+            cache=cache,
+        ),
+        maxsize=2,
+    )
+    docs = []
+    with driver.session() as session:
         with tqdm(
-            total=total_chunks,
             desc="Processing chunks (graph + index)",
             unit="chunk",
         ) as pbar:
-            for chunk_batch in batched(chunks, effective_batch_size):
-                if not chunk_batch:
-                    continue
-
-                futures = {
-                    executor.submit(extract_kg_from_chunk, chunk.text): idx
-                    for idx, chunk in enumerate(chunk_batch)
-                }
+            for chunk_batch, vecs, kg_list in embedded:
+                ent_rows: List[Dict[str, Any]] = []
+                rel_rows: List[Dict[str, Any]] = []
 
-                kg_list: List[Dict[str, Any]] = [None] * len(chunk_batch)
-
-                for future in as_completed(futures):
-                    idx = futures[future]
-                    try:
-                        kg_list[idx] = future.result()
-                    except Exception:
-                        kg_list[idx] = {"entities": [], "relations": []}
-
-                for chunk, kg in zip(chunk_batch, kg_list):
+                for chunk, kg, vec in zip(chunk_batch, kg_list, vecs):
                     if kg is None:
                         kg = {"entities": [], "relations": []}
 
-                    entities = kg.get("entities", []) or []
-                    relations = kg.get("relations", []) or []
-
-                    if entities:
-                        session.execute_write(
-                            upsert_entities,
-                            entities=entities,
+                    chunk_ent_rows = entity_rows(
+                        kg.get("entities", []) or [],
+                        source_file=chunk.source_file,
+                        section_path=chunk.section_path,
+                        doc_id=chunk.doc_id,
+                    )
+                    ent_rows.extend(chunk_ent_rows)
+                    rel_rows.extend(
+                        relation_rows(
+                            kg.get("relations", []) or [],
                             source_file=chunk.source_file,
-                            section_path=chunk.section_path,
-                            doc_id=chunk.doc_id,
                         )
+                    )
 
-                    if relations:
-                        session.execute_write(
-                            upsert_relations,
-                            relations=relations,
-                            source_file=chunk.source_file,
-                        )
+                    entity_ids = [row["id"] for row in chunk_ent_rows]
+                    docs.append(build_doc(chunk, entity_ids, vec))
+
+                # one UNWIND write per batch instead of one statement per entity
+                if ent_rows:
+                    session.execute_write(upsert_entities, rows=ent_rows)
+                if rel_rows:
+                    session.execute_write(upsert_relations, rows=rel_rows)
 
-                    entity_ids = [e.get("id") for e in entities if e.get("id")]
-                    index_chunk(chunk, entity_ids, embedder)
+                if len(docs) >= bulk_size:
+                    bulk_index_chunks(docs)
+                    docs = []
 
                 pbar.update(len(chunk_batch))
+            bulk_index_chunks(docs)
+
+    if cache is not None:
+        cache.close()
 
+    if pbar.n == 0:
+        print("No chunks found, nothing to ingest.")
+        return
 
     # ----- Image Ingestion ---------------------------------------------------------------------
     assets_root = Path(root_dir) / "assets"
@@ -132,7 +288,7 @@ def ingest_docs(root_dir: str, enable_graph: bool = False, batch_size: int = 32)
         print(f"No assets folder found at {assets_root}, skipping image ingestion.")
         return
 
-    img_embedder = ImageEmbedder(ImageEmbedderConfig(device="cpu")) 
+    img_embedder = ImageEmbedder(ImageEmbedderConfig())
     create_image_index(img_embedder)
 
     image_paths = _find_image_files(assets_root)
@@ -144,36 +300,38 @@ def ingest_docs(root_dir: str, enable_graph: bool = False, batch_size: int = 32)
 
     print(f"Found {total_images} images under {assets_root} → indexing with CLIP")
 
-    with tqdm(total=total_images, desc="Indexing images", unit="image") as pbar:
-        for path_batch in batched(image_paths, img_embedder.cfg.batch_size):
-            pil_images = []
-            valid_paths = []
-
-            for p in path_batch:
-                try:
-                    img = Image.open(p).convert("RGB")
-                    pil_images.append(img)
-                    valid_paths.append(p)
-                except Exception:
-                    continue
-
-            if not pil_images:
+    image_docs: List[Dict[str, Any]] = []
+    with tqdm(total=total_images, desc="Indexing images", unit="image") as pbar, \
+            ThreadPoolExecutor(max_workers=8) as decoder:
+        # decode → embed → index: while one batch embeds, the next decodes and the
+        # previous one is indexed here on the main thread
+        path_batches = batched(image_paths, img_embedder.cfg.batch_size)
+        decoded = prefetch(_decode_images(path_batches, decoder), maxsize=2)
+        embedded_images = prefetch(_embed_images(decoded, img_embedder), maxsize=2)
+
+        for path_batch, valid_paths, vecs in embedded_images:
+            if vecs is None:
                 pbar.update(len(path_batch))
                 continue
 
-            vecs = img_embedder.embed_images(pil_images)
-
             for p, vec in zip(valid_paths, vecs):
                 # simple stable id based on path
-                image_id = hashlib.md5(p.as_posix().encode("utf-8")).hexdigest()
-
-                index_image(
-                    image_id=image_id,
-                    path=p.as_posix(),
-                    vector=vec,
+                image_id = hashlib.blake2b(p.as_posix().encode("utf-8"), digest_size=16).hexdigest()
+
+                image_docs.append(
+                    build_image_doc(
+                        image_id=image_id,
+                        path=p.as_posix(),
+                        vector=vec,
+                    )
                 )
 
+            if len(image_docs) >= bulk_size:
+                bulk_index_images(image_docs)
+                image_docs = []
+
             pbar.update(len(path_batch))
+        bulk_index_images(image_docs)
 
 
 if __name__ == "__main__":
@@ -1,47 +1,83 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import List, Optional
 from transformers import CLIPProcessor, CLIPModel
 import torch
+import torch.nn.functional as F
 import numpy as np
 
+def _default_device() -> str:
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
 @dataclass
 class ImageEmbedderConfig:
     model_id: str = "wkcn/TinyCLIP-ViT-61M-32-Text-29M-LAION400M"
-    device: str = "cpu"
+    device: str = field(default_factory=_default_device)
     batch_size: int = 16
-    enable_text: bool = True   
+    enable_text: bool = True
+    half_precision: bool = True   # fp16 weights + preprocessing on CUDA
 
 class ImageEmbedder:
 
     def __init__(self, cfg: ImageEmbedderConfig = ImageEmbedderConfig()):
         self.cfg = cfg
+        self.on_gpu = str(cfg.device).startswith("cuda")
+        self.dtype = torch.float16 if (cfg.half_precision and self.on_gpu) else torch.float32
         self.processor = CLIPProcessor.from_pretrained(cfg.model_id)
         self.model = CLIPModel.from_pretrained(cfg.model_id)
-        self.model.to(cfg.device)
+        self.model.to(cfg.device, dtype=self.dtype)
         self.model.eval()
 
-    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        # mirror the HF image processor (shortest-edge resize → center crop → normalize)
+        ip = self.processor.image_processor
+        self._short_edge = ip.size["shortest_edge"]
+        self._crop = (ip.crop_size["height"], ip.crop_size["width"])
+        self._mean = torch.tensor(ip.image_mean, device=cfg.device).view(1, 3, 1, 1)
+        self._std = torch.tensor(ip.image_std, device=cfg.device).view(1, 3, 1, 1)
+
+    def embed_texts(self, texts: List[str]) -> np.ndarray:
         if not self.cfg.enable_text:
             raise RuntimeError("Text path disabled; set enable_text=True.")
-        with torch.no_grad():
+        with torch.inference_mode():
             inputs = self.processor(text=texts, return_tensors="pt", padding=True, truncation=True)
             inputs = {k: v.to(self.cfg.device) for k, v in inputs.items()}
             feats = self.model.get_text_features(**inputs)
-            return feats.cpu().numpy().tolist()
+            return feats.float().cpu().numpy()
 
-    def embed_images(self, images: List["PIL.Image.Image"]) -> List[List[float]]:
-        with torch.no_grad():
-            inputs = self.processor(images=images, return_tensors="pt")
-            inputs = {k: v.to(self.cfg.device) for k, v in inputs.items()}
-            feats = self.model.get_image_features(**inputs)
-            return feats.cpu().numpy().tolist()
+    def _pixel_values_gpu(self, images: List["PIL.Image.Image"]) -> torch.Tensor:
+        crop_h, crop_w = self._crop
+        batch = []
+        for img in images:
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            x = torch.from_numpy(np.asarray(img, dtype=np.uint8)).to(self.cfg.device, non_blocking=True)
+            x = x.permute(2, 0, 1).unsqueeze(0).float()
+            h, w = x.shape[-2:]
+            if h <= w:
+                nh, nw = self._short_edge, int(self._short_edge * w / h)
+            else:
+                nh, nw = int(self._short_edge * h / w), self._short_edge
+            nh, nw = max(nh, crop_h), max(nw, crop_w)
+            x = F.interpolate(x, size=(nh, nw), mode="bicubic", align_corners=False, antialias=True)
+            top, left = (nh - crop_h) // 2, (nw - crop_w) // 2
+            batch.append(x[..., top:top + crop_h, left:left + crop_w])
+        pixels = torch.cat(batch).clamp_(0, 255).div_(255.0)
+        return ((pixels - self._mean) / self._std).to(self.dtype)
+
+    def embed_images(self, images: List["PIL.Image.Image"]) -> np.ndarray:
+        with torch.inference_mode():
+            if self.on_gpu:
+                pixel_values = self._pixel_values_gpu(images)
+            else:
+                pixel_values = self.processor(images=images, return_tensors="pt")["pixel_values"]
+                pixel_values = pixel_values.to(self.cfg.device, dtype=self.dtype)
+            feats = self.model.get_image_features(pixel_values=pixel_values)
+            return feats.float().cpu().numpy()
 
     @staticmethod
-    def cosine_sim_matrix(image_embs: List[List[float]], text_embs: List[List[float]]) -> List[List[float]]:
-        def normalize(x):
-            x = x.astype("float32")
-            n = np.linalg.norm(x, axis=1, keepdims=True) + 1e-12
-            return x / n
-        I = normalize(np.asarray(image_embs))
-        T = normalize(np.asarray(text_embs))
-        return (I @ T.T).tolist()
+    def cosine_sim_matrix(image_embs: np.ndarray, text_embs: np.ndarray) -> np.ndarray:
+        # one float32 copy per input, normalized in place, then a single SGEMM
+        I = np.array(image_embs, dtype=np.float32)
+        T = np.array(text_embs, dtype=np.float32)
+        I /= np.linalg.norm(I, axis=1, keepdims=True).clip(min=1e-12)
+        T /= np.linalg.norm(T, axis=1, keepdims=True).clip(min=1e-12)
+        return np.matmul(I, T.T)
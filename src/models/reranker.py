@@ -1,5 +1,6 @@
 from dataclasses import dataclass
 from typing import List
+import torch
 from sentence_transformers import CrossEncoder
 
 @dataclass
@@ -8,16 +9,27 @@ class CrossEncoderRerankerConfig:
     device: str = "cpu"
     max_length: int = 512
     batch_size: int = 16
+    half_precision: bool = True   # fp16 weights; CUDA only
 
 class CrossEncoderReranker:
     
     def __init__(self, cfg: CrossEncoderRerankerConfig = CrossEncoderRerankerConfig()):
         self.cfg = cfg
         self.model = CrossEncoder(cfg.model_id, max_length=cfg.max_length, device=cfg.device)
+        if cfg.half_precision and str(cfg.device).startswith("cuda"):
+            self.model.model.half()
         # warmup
         _ = self.model.predict([("warmup", "warmup")])
 
     def score(self, query: str, docs: List[str]) -> List[float]:
-        pairs = [(query, d) for d in docs]
-        scores = self.model.predict(pairs, batch_size=self.cfg.batch_size)
-        return [float(s) for s in scores]
+        if not docs:
+            return []
+        # length-sorted batches pad less; scores are returned in the caller's order
+        order = sorted(range(len(docs)), key=lambda i: len(docs[i]))
+        pairs = [(query, docs[i]) for i in order]
+        with torch.inference_mode():
+            scores = self.model.predict(pairs, batch_size=self.cfg.batch_size, show_progress_bar=False)
+        out = [0.0] * len(docs)
+        for i, s in zip(order, scores):
+            out[i] = float(s)
+        return out
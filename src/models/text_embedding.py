@@ -1,5 +1,7 @@
 from dataclasses import dataclass
 from typing import List
+import numpy as np
+import torch
 from sentence_transformers import SentenceTransformer
 
 @dataclass
@@ -9,6 +11,8 @@ class TextEmbedderConfig:
     normalize: bool = True
     trust_remote_code: bool = True
     batch_size: int = 32
+    half_precision: bool = True   # bf16 where supported, else fp16; CUDA only
+    compile: bool = False         # torch.compile the transformer (slow first batches, faster steady state)
 
 class TextEmbedding:
     def __init__(self, cfg: TextEmbedderConfig = TextEmbedderConfig()):
@@ -17,11 +21,24 @@ class TextEmbedding:
         self.model = SentenceTransformer(
             cfg.model_id, device=cfg.device, trust_remote_code=cfg.trust_remote_code
         )
+        if cfg.half_precision and str(cfg.device).startswith("cuda"):
+            if torch.cuda.is_bf16_supported():
+                self.model.bfloat16()
+            else:
+                self.model.half()
+        if cfg.compile:
+            # dynamic shapes: batch size and padded length vary per call
+            self.model[0].auto_model = torch.compile(self.model[0].auto_model, dynamic=True)
+        self.dtype = next(self.model.parameters()).dtype
         # warmup to build caches
         _ = self.model.encode(["warmup"], normalize_embeddings=cfg.normalize)
 
-    def embed(self, texts: List[str]) -> List[List[float]]:
+    def embed(self, texts: List[str]) -> np.ndarray:
         vecs = self.model.encode(
-            texts, batch_size=self.cfg.batch_size, normalize_embeddings=self.cfg.normalize
+            texts,
+            batch_size=self.cfg.batch_size,
+            normalize_embeddings=self.cfg.normalize,
+            convert_to_numpy=True,
         )
-        return vecs.tolist()
+        # float32 rows; callers convert to lists only when serializing
+        return vecs.astype(np.float32, copy=False)
@@ -1,13 +1,71 @@
-from typing import List, Dict, Any
+import asyncio
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Hashable, Optional, Tuple
+import numpy as np
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from PIL import Image
 
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
 from models.text_embedding import TextEmbedding
 from models.image_embedding import ImageEmbedder
 from models.reranker import CrossEncoderReranker
 
 
-class SearchClient:
+# cross-encoder input is capped at max_length tokens anyway; cut long chunks before
+# tokenization instead of after
+RERANK_MAX_CHARS = 2000
+
+# image hits only need to point at the file
+IMAGE_FIELDS = ["image_id", "path"]
+
+# query vectors stay float32 ndarrays all the way to the wire: shortest float32
+# reprs are roughly half the bytes of Python float reprs
+_ORJSON_OPTS = orjson.OPT_SERIALIZE_NUMPY
+
+
+class _LRUCache:
+    """Small thread-safe LRU map; ``maxsize <= 0`` disables it."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class _SearchBase:
+    """Caches, request bodies and reranking shared by SearchClient and AsyncSearchClient."""
+
     def __init__(
         self,
         opensearch_url: str = "http://localhost:9200",
@@ -16,6 +74,8 @@ class SearchClient:
         text_embedder: TextEmbedding | None = None,
         image_embedder: ImageEmbedder | None = None,
         reranker: CrossEncoderReranker | None = None,
+        cache_size: int = 4096,
+        knn_cache_size: int = 256,
     ):
         self.opensearch_url = opensearch_url.rstrip("/")
         self.text_index = text_index
@@ -23,69 +83,283 @@ class SearchClient:
         self.text_embedder = text_embedder
         self.image_embedder = image_embedder
         self.reranker = reranker
+        # exact-match caches: query → embedding, request body → hits, (query, doc) → score
+        self._embed_text = functools.lru_cache(maxsize=cache_size)(self._embed_text_uncached)
+        self._embed_image_text = functools.lru_cache(maxsize=cache_size)(self._embed_image_text_uncached)
+        # hit lists carry full chunk text (up to knn_k × ~2.5KB each), so keep far fewer;
+        # call cache_clear() after re-ingesting
+        self._knn_cache = _LRUCache(knn_cache_size)
+        self._rerank_cache = _LRUCache(cache_size)
+
+    def cache_clear(self) -> None:
+        self._embed_text.cache_clear()
+        self._embed_image_text.cache_clear()
+        self._knn_cache.clear()
+        self._rerank_cache.clear()
+
+    def _embed_text_uncached(self, query: str) -> np.ndarray:
+        vec = np.ascontiguousarray(self.text_embedder.embed([query])[0], dtype=np.float32)
+        vec.setflags(write=False)  # shared by every cache hit
+        return vec
 
-    def knn_search(self,index: str, field: str, query_vector: List[float], k: int = 5) -> List[Dict[str, Any]]:
-        body = {
+    def _embed_image_text_uncached(self, query: str) -> np.ndarray:
+        vec = np.ascontiguousarray(self.image_embedder.embed_texts([query])[0], dtype=np.float32)
+        vec.setflags(write=False)
+        return vec
+
+    @staticmethod
+    def _digest(data: bytes) -> bytes:
+        return hashlib.blake2b(data, digest_size=16).digest()
+
+    @staticmethod
+    def _knn_body(
+        field: str,
+        query_vector: List[float] | np.ndarray,
+        k: int,
+        num_candidates: Optional[int] = None,
+        fields: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        query_vector = np.ascontiguousarray(query_vector, dtype=np.float32)
+        return {
             "size": k,
+            # never ship the stored vectors back; they dwarf the rest of each hit
+            "_source": {"includes": list(fields)} if fields else {"excludes": [field]},
             "query": {
                 "knn": {
-                    field: {  
+                    field: {
                         "vector": query_vector,
-                        "k": k,
+                        # candidates gathered per shard before the top `size` are returned
+                        "k": max(k, num_candidates or k),
                     }
                 }
             },
         }
 
-        resp = requests.post(
-            f"{self.opensearch_url}/{index}/_search",
-            json=body,
-            headers={"Content-Type": "application/json"},
+    def _msearch_plan(self, searches: List[Tuple[str, Dict[str, Any]]]):
+        """Cache lookups for an _msearch; returns (keys, results, todo, ndjson payload of the misses)."""
+        bodies = [orjson.dumps(body, option=_ORJSON_OPTS) for _, body in searches]
+        keys = [(index, self._digest(b)) for (index, _), b in zip(searches, bodies)]
+        results: List[Optional[List[Dict[str, Any]]]] = [self._knn_cache.get(key) for key in keys]
+        todo = [i for i, hits in enumerate(results) if hits is None]
+
+        lines = []
+        for i in todo:
+            lines.append(orjson.dumps({"index": searches[i][0]}))
+            lines.append(bodies[i])
+        payload = b"\n".join(lines) + b"\n"
+        return keys, results, todo, payload
+
+    def _msearch_fill(self, keys, results, todo, content: bytes) -> Optional[Dict[str, Any]]:
+        """Store _msearch responses into results/cache; returns the first sub-search error, if any."""
+        for i, item in zip(todo, orjson.loads(content)["responses"]):
+            if "error" in item:
+                print("OpenSearch error:", item["error"])
+                return item["error"]
+            results[i] = item["hits"]["hits"]
+            self._knn_cache.put(keys[i], results[i])
+        return None
+
+    def _score(self, query: str, docs: List[str]) -> List[float]:
+        # a cross-encoder forward is the priciest step; only score unseen (query, doc) pairs
+        keys = [(query, self._digest(d.encode("utf-8"))) for d in docs]
+        scores = [self._rerank_cache.get(key) for key in keys]
+        todo = [i for i, s in enumerate(scores) if s is None]
+        if todo:
+            for i, s in zip(todo, self.reranker.score(query, [docs[i] for i in todo])):
+                scores[i] = s
+                self._rerank_cache.put(keys[i], s)
+        return scores
+
+    @staticmethod
+    def _dedup_hits(hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Drop repeated chunks, keeping the first (highest KNN score) copy.
+
+        Keys on whitespace/case-normalized text, which also catches the same paragraph
+        re-wrapped on another (versioned) page.
+        """
+        seen: set[bytes] = set()
+        kept = []
+        for h in hits:
+            text = h["_source"].get("text") or ""
+            key = hashlib.blake2b(
+                " ".join(text.split()).casefold().encode("utf-8"), digest_size=16
+            ).digest()
+            if key in seen:
+                continue
+            seen.add(key)
+            kept.append(h)
+        return kept
+
+    def _rerank(
+        self,
+        query: str,
+        hits: List[Dict[str, Any]],
+        top_k: int,
+        max_chars: int = RERANK_MAX_CHARS,
+    ) -> List[Dict[str, Any]]:
+        # duplicates would only burn reranker FLOPs and crowd the top_k
+        hits = self._dedup_hits(hits)
+        docs = [h["_source"]["text"][:max_chars] for h in hits]
+        scores = self._score(query, docs)
+
+        for h, s in zip(hits, scores):
+            h["_rerank_score"] = s
+
+        # N is only knn_k (~50): one stable C-level sort keeps ties in KNN order,
+        # exactly like sorted(..., reverse=True)
+        scores_np = np.asarray(scores, dtype=np.float32)
+        idx = np.argsort(-scores_np, kind="stable")[:max(top_k, 0)]
+        return [hits[i] for i in idx]
+
+    def _multimodal_searches(
+        self,
+        text_vec: np.ndarray,
+        image_vec: np.ndarray,
+        text_k: int,
+        image_k: int,
+        text_num_candidates: int,
+        image_num_candidates: int,
+    ) -> List[Tuple[str, Dict[str, Any]]]:
+        return [
+            (
+                self.text_index,
+                self._knn_body("vector", text_vec, text_k, text_num_candidates),
+            ),
+            (
+                self.image_index,
+                self._knn_body("vector", image_vec, image_k, image_num_candidates, fields=IMAGE_FIELDS),
+            ),
+        ]
+
+
+class SearchClient(_SearchBase):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # keep-alive connection pool reused by every search
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=32,
+            max_retries=Retry(
+                total=2,
+                backoff_factor=0.1,
+                status_forcelist=[502, 503, 504],
+                allowed_methods=frozenset({"GET", "POST"}),  # searches are read-only
+            ),
         )
-        try:
-            resp.raise_for_status()
-        except requests.HTTPError:
-            print("OpenSearch error:", resp.text)
-            raise
-        data = resp.json()
-        return data["hits"]["hits"]
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._session.headers.update({"Content-Type": "application/json", "Connection": "keep-alive"})
+        # text + image query embeddings run side by side (torch releases the GIL)
+        self._executor = ThreadPoolExecutor(max_workers=2)
+
+    def knn_search(
+        self,
+        index: str,
+        field: str,
+        query_vector: List[float] | np.ndarray,
+        k: int = 5,
+        fields: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        payload = orjson.dumps(self._knn_body(field, query_vector, k, fields=fields), option=_ORJSON_OPTS)
+        key = (index, self._digest(payload))
+        hits = self._knn_cache.get(key)
+        if hits is None:
+            resp = self._session.post(
+                f"{self.opensearch_url}/{index}/_search",
+                data=payload,
+            )
+            try:
+                resp.raise_for_status()
+            except requests.HTTPError:
+                print("OpenSearch error:", resp.text)
+                raise
+            data = orjson.loads(resp.content)
+            hits = data["hits"]["hits"]
+            self._knn_cache.put(key, hits)
+        # callers annotate hits (e.g. _rerank_score); keep the cached ones pristine
+        return [dict(h) for h in hits]
+
 
+    def msearch(self, searches: List[Tuple[str, Dict[str, Any]]]) -> List[List[Dict[str, Any]]]:
+        """Run several (index, body) searches in one _msearch round-trip; hits come back in order."""
+        keys, results, todo, payload = self._msearch_plan(searches)
 
-    def search_text(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
-        vec = self.text_embedder.embed([query])[0]
+        if todo:
+            resp = self._session.post(
+                f"{self.opensearch_url}/_msearch",
+                data=payload,
+                headers={"Content-Type": "application/x-ndjson"},
+            )
+            try:
+                resp.raise_for_status()
+            except requests.HTTPError:
+                print("OpenSearch error:", resp.text)
+                raise
+
+            error = self._msearch_fill(keys, results, todo, resp.content)
+            if error is not None:
+                raise requests.HTTPError(f"_msearch sub-search failed: {error}", response=resp)
+
+        return [[dict(h) for h in hits] for hits in results]
+
+
+    def search_text(self, query: str, k: int = 5, fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        vec = self._embed_text(query)
         return self.knn_search(
             index=self.text_index,
             field="vector",
             query_vector=vec,
             k=k,
+            fields=fields,
         )
-    
 
-    def search_text_reranked(self, query: str, knn_k: int = 50, top_k: int = 10) -> List[Dict[str, Any]]:
+
+    def search_text_batch(
+        self,
+        queries: List[str],
+        k: int = 5,
+        fields: Optional[List[str]] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """One batched embedder forward and one _msearch for many queries; hits per query, in order."""
+        if not queries:
+            return []
+        vecs = np.asarray(self.text_embedder.embed(list(queries)), dtype=np.float32)
+        return self.msearch([
+            (self.text_index, self._knn_body("vector", vec, k, fields=fields))
+            for vec in vecs
+        ])
+
+
+    def search_text_reranked(
+        self,
+        query: str,
+        knn_k: int = 50,
+        top_k: int = 10,
+        max_chars: int = RERANK_MAX_CHARS,
+    ) -> List[Dict[str, Any]]:
         hits = self.knn_search(
             index=self.text_index,
             field="vector",
-            query_vector=self.text_embedder.embed([query])[0],
+            query_vector=self._embed_text(query),
             k=knn_k,
         )
+        return self._rerank(query, hits, top_k, max_chars=max_chars)
 
-        docs = [h["_source"]["text"] for h in hits]
-        scores = self.reranker.score(query, docs)
-
-        for h, s in zip(hits, scores):
-            h["_rerank_score"] = s
 
-        hits = sorted(hits, key=lambda x: x["_rerank_score"], reverse=True)
-        return hits[:top_k]
-
-
-    def search_images(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
-        vec = self.image_embedder.embed_texts([query])[0]
+    def search_images(
+        self,
+        query: str,
+        k: int = 5,
+        fields: Optional[List[str]] = IMAGE_FIELDS,
+    ) -> List[Dict[str, Any]]:
+        vec = self._embed_image_text(query)
         return self.knn_search(
             index=self.image_index,
             field="vector",
             query_vector=vec,
             k=k,
+            fields=fields,
         )
 
 
@@ -100,27 +374,175 @@ class SearchClient:
         text_knn_k: int = 50,
     ) -> Dict[str, List[Dict[str, Any]]]:
 
-        if rerank_text and self.reranker is not None:
-            text_hits = self.search_text_reranked(
-                query=query,
-                knn_k=text_knn_k,
-                top_k=text_k,
-                num_candidates=text_num_candidates,
-            )
-        else:
-            text_hits = self.search_text(
-                query=query,
-                k=text_k,
-                num_candidates=text_num_candidates,
+        rerank = rerank_text and self.reranker is not None
+        f_text = self._executor.submit(self._embed_text, query)
+        f_image = self._executor.submit(self._embed_image_text, query)
+        text_vec = f_text.result()
+        image_vec = f_image.result()
+
+        # text + image KNN in a single _msearch round-trip
+        text_hits, image_hits = self.msearch(self._multimodal_searches(
+            text_vec, image_vec, text_knn_k if rerank else text_k, image_k,
+            text_num_candidates, image_num_candidates,
+        ))
+
+        if rerank:
+            text_hits = self._rerank(query, text_hits, text_k)
+
+        return {
+            "text_hits": text_hits,
+            "image_hits": image_hits,
+        }
+
+
+class AsyncSearchClient(_SearchBase):
+    """asyncio counterpart of SearchClient over one shared, pooled httpx.AsyncClient.
+
+    Same caches, request bodies and reranking (via _SearchBase), with coroutine
+    search methods. Model forwards run in worker threads so the event loop keeps
+    serving other requests. Close with ``await client.aclose()`` (or ``async with``).
+
+    HTTP/2 is only negotiated over TLS (ALPN), i.e. for an ``https://`` OpenSearch
+    URL; against plain ``http://`` the pool speaks HTTP/1.1 keep-alive.
+    """
+
+    def __init__(
+        self,
+        *args,
+        max_connections: int = 64,
+        max_keepalive_connections: int = 32,
+        **kwargs,
+    ):
+        if httpx is None:
+            raise ImportError("AsyncSearchClient needs httpx: pip install 'httpx[http2]'")
+        super().__init__(*args, **kwargs)
+        self._client = httpx.AsyncClient(
+            headers={"Content-Type": "application/json"},
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,  # takes effect on https:// only
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_keepalive_connections,
+                ),
+                retries=2,  # connect errors only
+            ),
+        )
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    async def __aenter__(self) -> "AsyncSearchClient":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.aclose()
+
+    async def _post(self, url: str, payload: bytes, **kwargs) -> "httpx.Response":
+        resp = await self._client.post(url, content=payload, **kwargs)
+        try:
+            resp.raise_for_status()
+        except httpx.HTTPStatusError:
+            print("OpenSearch error:", resp.text)
+            raise
+        return resp
+
+    async def knn_search(
+        self,
+        index: str,
+        field: str,
+        query_vector: List[float] | np.ndarray,
+        k: int = 5,
+        fields: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        payload = orjson.dumps(self._knn_body(field, query_vector, k, fields=fields), option=_ORJSON_OPTS)
+        key = (index, self._digest(payload))
+        hits = self._knn_cache.get(key)
+        if hits is None:
+            resp = await self._post(f"{self.opensearch_url}/{index}/_search", payload)
+            hits = orjson.loads(resp.content)["hits"]["hits"]
+            self._knn_cache.put(key, hits)
+        return [dict(h) for h in hits]
+
+    async def msearch(self, searches: List[Tuple[str, Dict[str, Any]]]) -> List[List[Dict[str, Any]]]:
+        keys, results, todo, payload = self._msearch_plan(searches)
+        if todo:
+            resp = await self._post(
+                f"{self.opensearch_url}/_msearch",
+                payload,
+                headers={"Content-Type": "application/x-ndjson"},
             )
+            error = self._msearch_fill(keys, results, todo, resp.content)
+            if error is not None:
+                raise httpx.HTTPStatusError(
+                    f"_msearch sub-search failed: {error}", request=resp.request, response=resp
+                )
+        return [[dict(h) for h in hits] for hits in results]
+
+    async def search_text(self, query: str, k: int = 5, fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        vec = await asyncio.to_thread(self._embed_text, query)
+        return await self.knn_search(self.text_index, "vector", vec, k=k, fields=fields)
+
+    async def search_text_batch(
+        self,
+        queries: List[str],
+        k: int = 5,
+        fields: Optional[List[str]] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        if not queries:
+            return []
+        vecs = await asyncio.to_thread(self.text_embedder.embed, list(queries))
+        vecs = np.asarray(vecs, dtype=np.float32)
+        return await self.msearch([
+            (self.text_index, self._knn_body("vector", vec, k, fields=fields))
+            for vec in vecs
+        ])
+
+    async def search_text_reranked(
+        self,
+        query: str,
+        knn_k: int = 50,
+        top_k: int = 10,
+        max_chars: int = RERANK_MAX_CHARS,
+    ) -> List[Dict[str, Any]]:
+        vec = await asyncio.to_thread(self._embed_text, query)
+        hits = await self.knn_search(self.text_index, "vector", vec, k=knn_k)
+        return await asyncio.to_thread(self._rerank, query, hits, top_k, max_chars)
+
+    async def search_images(
+        self,
+        query: str,
+        k: int = 5,
+        fields: Optional[List[str]] = IMAGE_FIELDS,
+    ) -> List[Dict[str, Any]]:
+        vec = await asyncio.to_thread(self._embed_image_text, query)
+        return await self.knn_search(self.image_index, "vector", vec, k=k, fields=fields)
 
-        image_hits = self.search_images(
-            query=query,
-            k=image_k,
-            num_candidates=image_num_candidates,
+    async def search_multimodal(
+        self,
+        query: str,
+        text_k: int = 5,
+        image_k: int = 2,
+        text_num_candidates: int = 50,
+        image_num_candidates: int = 10,
+        rerank_text: bool = True,
+        text_knn_k: int = 50,
+    ) -> Dict[str, List[Dict[str, Any]]]:
+
+        rerank = rerank_text and self.reranker is not None
+        text_vec, image_vec = await asyncio.gather(
+            asyncio.to_thread(self._embed_text, query),
+            asyncio.to_thread(self._embed_image_text, query),
         )
 
+        text_hits, image_hits = await self.msearch(self._multimodal_searches(
+            text_vec, image_vec, text_knn_k if rerank else text_k, image_k,
+            text_num_candidates, image_num_candidates,
+        ))
+
+        if rerank:
+            text_hits = await asyncio.to_thread(self._rerank, query, text_hits, text_k)
+
         return {
             "text_hits": text_hits,
             "image_hits": image_hits,
-        }
\ No newline at end of file
+        }
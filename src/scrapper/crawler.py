@@ -1,7 +1,7 @@
 # src/scrapper/scrapper.py
-import os, re, hashlib
+import os, re, hashlib, functools, json
 from pathlib import Path
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urljoin, urlparse, urlsplit
 
 import scrapy
 from scrapy.http import HtmlResponse
@@ -13,6 +13,43 @@ except Exception:
     PageMethod = None
 
 
+# bs4 tag names are already lowercase; no .lower() needed anywhere below
+_BLOCK_TAGS = frozenset({"h1", "h2", "h3", "h4", "h5", "h6", "p", "pre", "ul", "ol", "blockquote", "table", "img"})
+_HEADING_LEVELS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+_LIST_TAGS = frozenset({"ul", "ol"})
+_LIST_SKIP = frozenset({"ul", "ol", "pre", "p"})
+_SAFE_NAME_RE = re.compile(r"[^a-zA-Z0-9._-]+")
+
+# hrefs urljoin would strip, normalize or reject; these skip _urljoin's fast paths
+_SLOW_HREF_RE = re.compile(r"[\t\r\n\[\];]|\?#|[?#]$|^[\x00- ]")
+# a page joins hundreds of hrefs against the same one or two base URLs
+_split_base = functools.lru_cache(maxsize=256)(urlsplit)
+
+
+def _urljoin(base: str, href: str) -> str:
+    """urljoin with straight-line fast paths for the common href shapes.
+
+    Only plain absolute, scheme-relative and root-relative hrefs take a fast path.
+    Anything urljoin would rewrite or reject goes to urljoin itself: dot or empty
+    segments, empty hosts, params, dangling ``?``/``#``, leading controls/spaces,
+    embedded tab/CR/LF (stripped by urljoin), bracketed hosts and non-ASCII input.
+    """
+    if _SLOW_HREF_RE.search(href) or not href.isascii():
+        return urljoin(base, href)
+    if href.startswith(("https://", "http://")):
+        if href[href.index("//") + 2:href.index("//") + 3] not in ("", "/", "?", "#"):
+            return href
+    elif href.startswith("//"):
+        if href[2:3] not in ("", "/", "?", "#") and "/." not in href:
+            scheme = _split_base(base).scheme
+            if scheme:
+                return f"{scheme}:{href}"
+    elif href.startswith("/") and "/." not in href and "//" not in href:
+        b = _split_base(base)
+        if b.scheme and b.netloc:
+            return f"{b.scheme}://{b.netloc}{href}"
+    return urljoin(base, href)
+
 class DocsCrawler(scrapy.Spider):
     name = "minimal_docs_crawler"
 
@@ -39,6 +76,18 @@ class DocsCrawler(scrapy.Spider):
 
     IMG_EXTS = (".png", ".jpg", ".jpeg", ".gif", ".webp")
 
+    # mixed into each page's content hash: bump whenever the markdown output changes,
+    # so pages written by an older renderer are regenerated on the next crawl
+    RENDER_VERSION = 1
+    # crawl state is flushed every this many written pages, not only on a clean close
+    STATE_FLUSH_EVERY = 25
+
+    # page chrome dropped from the main content, matched in one select() pass
+    STRIP_SELECTOR = ", ".join([
+        "nav", "header", "footer", "aside", ".breadcrumbs", ".toc", "[role='navigation']",
+        ".cookie", ".cookie-banner", ".ads", ".sidebar",
+    ])
+
     def __init__(self, start_url=None, depth=None, **kwargs):
         super().__init__(**kwargs)
         if not start_url:
@@ -55,207 +104,314 @@ class DocsCrawler(scrapy.Spider):
         self.out_dir = Path(f"scrapped_data/{host}")
         self.assets_dir = self.out_dir / "assets"
         self.assets_dir.mkdir(parents=True, exist_ok=True)
+        self._assets_path = os.fspath(self.assets_dir)
+
+        # state from earlier crawls of this host: pages that only render in a browser,
+        # and a hash of each page's main content when its markdown was last written
+        self._playwright_urls_path = self.out_dir / ".playwright_urls"
+        self._page_hashes_path = self.out_dir / ".page_hashes.json"
+        self._playwright_required = set()
+        if self._playwright_urls_path.exists():
+            self._playwright_required = set(self._playwright_urls_path.read_text(encoding="utf-8").split())
+        self._page_hashes = {}
+        if self._page_hashes_path.exists():
+            self._page_hashes = json.loads(self._page_hashes_path.read_text(encoding="utf-8"))
+        self._pages_since_flush = 0
+
+        # asset requests bypass the dupefilter (dont_filter), so shared logos/icons
+        # would otherwise be fetched once per page that shows them
+        self._seen_assets = set()
 
     async def start(self):
-        yield scrapy.Request(self.start_urls[0], callback=self.parse)
+        yield self._page_request(self.start_urls[0])
+
+    def closed(self, reason):
+        self._save_state()
+
+    def _save_state(self):
+        # write-then-rename, so a crash mid-flush never leaves a truncated state file
+        for path, text in (
+            (self._playwright_urls_path, "\n".join(sorted(self._playwright_required)) + "\n"),
+            (self._page_hashes_path, json.dumps(self._page_hashes, sort_keys=True)),
+        ):
+            tmp = path.with_name(path.name + ".tmp")
+            tmp.write_text(text, encoding="utf-8")
+            os.replace(tmp, path)
+        self._pages_since_flush = 0
+
+    def _page_request(self, url: str):
+        # skip the plain fetch for pages a previous crawl already had to render
+        if url in self._playwright_required:
+            return self._playwright_request(url)
+        return scrapy.Request(url, callback=self.parse)
+
+    def _playwright_request(self, url: str, dont_filter: bool = False):
+        meta = {"playwright": True, "from_playwright": True}
+        if PageMethod is not None:
+            meta["playwright_page_methods"] = [
+                PageMethod("wait_for_load_state", state="domcontentloaded"),
+                PageMethod("wait_for_load_state", state="networkidle"),
+                PageMethod("wait_for_timeout", 400),
+            ]
+        return scrapy.Request(url, callback=self.parse, dont_filter=dont_filter, meta=meta)
 
     def parse(self, response: HtmlResponse):
         # ---- Playwright fallback: 403 or effectively empty ----
-        if (response.status == 403 or self._looks_empty(response)) and not response.meta.get("from_playwright"):
+        # the page is parsed exactly once; the same tree feeds the empty check and markdown
+        soup = None if response.status == 403 else self._parse_content(response)
+        blocked = soup is None
+        if blocked and not response.meta.get("from_playwright"):
             self.logger.warning(f"{'403' if response.status == 403 else 'Empty'} at {response.url}; retrying with Playwright…")
-            meta = {"playwright": True, "from_playwright": True}
-            if PageMethod is not None:
-                meta["playwright_page_methods"] = [
-                    PageMethod("wait_for_load_state", state="domcontentloaded"),
-                    PageMethod("wait_for_load_state", state="networkidle"),
-                    PageMethod("wait_for_timeout", 400),
-                ]
-            yield scrapy.Request(response.url, callback=self.parse, dont_filter=True, meta=meta)
+            yield self._playwright_request(response.url, dont_filter=True)
             return
 
-        if (response.status == 403 or self._looks_empty(response)) and response.meta.get("from_playwright"):
+        if blocked:
             self.logger.warning(f"Skipping blocked/empty even with Playwright: {response.url}")
+            self._playwright_required.discard(response.url)
             return
 
+        if response.meta.get("from_playwright"):
+            self._playwright_required.add(response.url)
+
         if not isinstance(response, HtmlResponse):
             return
 
         url = response.url
-        soup = BeautifulSoup(response.text, "html.parser")
 
         canonical = soup.find("link", rel="canonical")
-        canon_url = urljoin(url, canonical["href"].strip()) if canonical and canonical.get("href") else url
+        canon_url = _urljoin(url, canonical["href"].strip()) if canonical and canonical.get("href") else url
 
         main = (soup.find("main") or soup.find("article") or soup.find(attrs={"role": "main"})
                 or soup.select_one("[data-docs-content], .markdown, .docContent, .prose") or soup.body)
 
-        for sel in ["nav","header","footer","aside",".breadcrumbs",".toc","[role='navigation']",
-                    ".cookie",".cookie-banner",".ads",".sidebar"]:
-            for n in main.select(sel):
-                n.decompose()
+        for n in main.select(self.STRIP_SELECTOR):
+            n.decompose()
 
         title = (soup.title.string.strip() if soup.title and soup.title.string else "").strip()
         h1 = main.find("h1")
         if h1 and h1.get_text(strip=True):
             title = h1.get_text(strip=True)
 
-        lines = []
-        lines.append(f"# {title}" if title else "# (untitled)")
-        lines.append("")
-        lines.append(f"> Source: {canon_url}")
-        lines.append("")
-
-        # ---- Build Markdown ----
-        for node in self._iter_blocks(main):
-            name = node.name.lower()
-            if name == "img":
-                src = (node.get("src") or "").strip()
-                if src:
-                    abs_url = urljoin(canon_url, src)
-                    fname = self._planned_asset_name(abs_url)
-                    alt = (node.get("alt") or "").strip()
-                    # schedule image download
-                    yield scrapy.Request(abs_url, callback=self._save_image_response, dont_filter=True,
-                                         meta={"planned_name": fname})
-                    # add markdown reference
-                    lines.append(f"![{alt}]({self._rel_asset(fname)})")
-                    lines.append("")
-                continue  # handled
-            # Everything else goes through the helper (returns ONLY strings/lists)
-            md = self._block_to_md(node, canon_url)
-            if md:
-                if isinstance(md, list):
-                    lines.extend(md)
-                else:
-                    lines.append(md)
-
-        # ---- Write .md ----
+        # ---- Write .md (streamed; images collected on the way) ----
         md_name = self._page_slug(canon_url) + ".md"
         md_path = self.out_dir / md_name
-        md_path.write_text("\n".join(self._squash_blank_lines(lines)).rstrip() + "\n", encoding="utf-8")
-        self.logger.info(f"Saved markdown: {md_name}")
+        digest = hashlib.blake2b(
+            f"{self.RENDER_VERSION}\0{title}\0{main}".encode("utf-8"), digest_size=16
+        ).hexdigest()
+        if self._page_hashes.get(canon_url) == digest and md_path.exists():
+            # unchanged since the last crawl: the markdown is current, but an asset
+            # download may have failed or never run, so re-request whatever is missing
+            self.logger.info(f"Unchanged: {md_name}")
+            images = [
+                (abs_url, fname) for abs_url, fname in self._page_images(main, canon_url)
+                if not os.path.exists(os.path.join(self._assets_path, fname))
+            ]
+        else:
+            images = []
+            self._write_markdown(md_path, self._page_lines(main, title, canon_url, images))
+            self._page_hashes[canon_url] = digest
+            self.logger.info(f"Saved markdown: {md_name}")
+            self._pages_since_flush += 1
+            if self._pages_since_flush >= self.STATE_FLUSH_EVERY:
+                self._save_state()
+
+        # schedule image downloads
+        for abs_url, fname in images:
+            if abs_url in self._seen_assets:
+                continue
+            self._seen_assets.add(abs_url)
+            yield scrapy.Request(abs_url, callback=self._save_image_response, dont_filter=True,
+                                 meta={"planned_name": fname})
 
         # ---- Follow internal links ----
         for a in soup.find_all("a", href=True):
             href = (a["href"] or "").strip()
             if not href or href.startswith("#") or href.lower().startswith(("mailto:", "javascript:")):
                 continue
-            abs_url = urljoin(url, href)
-            netloc = urlparse(abs_url).netloc.split(":")[0]
+            abs_url = _urljoin(url, href)
+            netloc = urlsplit(abs_url).netloc.split(":")[0]
             if netloc != self.allowed_domain:
                 continue
             if any(abs_url.lower().endswith(ext) for ext in self.IMG_EXTS):
-                yield scrapy.Request(abs_url, callback=self._save_image_response, dont_filter=True)
+                if abs_url in self._seen_assets:
+                    continue
+                self._seen_assets.add(abs_url)
+                # same planned name as an <img> of this URL, so whichever request wins the
+                # seen-set writes the file every page's markdown links to
+                yield scrapy.Request(abs_url, callback=self._save_image_response, dont_filter=True,
+                                     meta={"planned_name": self._planned_asset_name(abs_url)})
             else:
-                yield scrapy.Request(abs_url, callback=self.parse)
+                yield self._page_request(abs_url)
 
     # --------- helpers ---------
-    def _looks_empty(self, response: HtmlResponse) -> bool:
+    def _parse_content(self, response: HtmlResponse):
+        """The page's soup, or None when it is effectively empty."""
         txt = (response.text or "").strip()
         if len(txt) < 800:
-            return True
-        soup = BeautifulSoup(response.text, "html.parser")
-        return not bool(soup.find(["h1", "h2", "p", "pre", "article", "main"]))
+            return None
+        soup = BeautifulSoup(response.text, "lxml")
+        if not soup.find(["h1", "h2", "p", "pre", "article", "main"]):
+            return None
+        return soup
 
     def _iter_blocks(self, root: Tag):
-        for node in root.descendants:
-            if isinstance(node, Tag):
-                n = node.name.lower()
-                if n in {"h1","h2","h3","h4","h5","h6","p","pre","ul","ol","blockquote","table","img"}:
-                    yield node
+        # pre-order walk that stops at block tags: their subtree is rendered by
+        # _block_to_md, so nested blocks must not be visited (and emitted) again
+        stack = list(reversed(root.contents))
+        while stack:
+            node = stack.pop()
+            if node.__class__ is not Tag:
+                continue
+            if node.name in _BLOCK_TAGS:
+                yield node
+                if node.name != "img":
+                    yield from node.find_all("img")
+            else:
+                stack.extend(reversed(node.contents))
+
+    def _page_images(self, main: Tag, base_url: str):
+        # the same (url, planned name) pairs _page_lines collects, without rendering
+        for node in main.find_all("img"):
+            src = (node.get("src") or "").strip()
+            if src:
+                abs_url = _urljoin(base_url, src)
+                yield abs_url, self._planned_asset_name(abs_url)
+
+    def _page_lines(self, main: Tag, title: str, base_url: str, images: list):
+        yield f"# {title}" if title else "# (untitled)"
+        yield ""
+        yield f"> Source: {base_url}"
+        yield ""
+        for node in self._iter_blocks(main):
+            if node.name == "img":
+                src = (node.get("src") or "").strip()
+                if src:
+                    abs_url = _urljoin(base_url, src)
+                    fname = self._planned_asset_name(abs_url)
+                    alt = (node.get("alt") or "").strip()
+                    images.append((abs_url, fname))
+                    yield f"![{alt}]({self._rel_asset(fname)})"
+                    yield ""
+                continue
+            yield from self._block_to_md(node, base_url)
+
+    @staticmethod
+    def _write_markdown(path: Path, lines) -> None:
+        # runs of blank lines collapse to one; blanks are only written once a
+        # non-blank line follows, so the file never ends in blank lines
+        with open(path, "wb") as f:
+            w = f.write
+            pending_blank = False
+            for ln in lines:
+                s = "" if ln is None else str(ln)
+                if not s or s.isspace():  # no stripped copy per line
+                    pending_blank = True
+                    continue
+                if pending_blank:
+                    w(b"\n")
+                    pending_blank = False
+                w(s.encode("utf-8"))
+                w(b"\n")
 
     def _block_to_md(self, node: Tag, base_url: str):
-        name = node.name.lower()
-        if name.startswith("h") and len(name) == 2 and name[1].isdigit():
-            lvl = int(name[1]); text = self._inline_text(node, base_url)
-            return "#" * lvl + f" {text}"
-        if name == "p":
+        name = node.name
+        lvl = _HEADING_LEVELS.get(name)
+        if lvl:
+            yield "#" * lvl + f" {self._inline_text(node, base_url)}"
+        elif name == "p":
             txt = self._inline_text(node, base_url)
-            return [txt, ""] if txt else None
-        if name == "pre":
+            if txt:
+                yield txt
+                yield ""
+        elif name == "pre":
             code = node.get_text().rstrip("\n")
-            return ["```", code, "```", ""] if code else None
-        if name in {"ul","ol"}:
-            ordered = name == "ol"; lines = []
-            self._render_list(node, lines, depth=0, ordered=ordered, base_url=base_url)
-            lines.append(""); return lines
-        if name == "blockquote":
+            if code:
+                yield from ("```", code, "```", "")
+        elif name in _LIST_TAGS:
+            yield from self._render_list(node, depth=0, ordered=(name == "ol"), base_url=base_url)
+            yield ""
+        elif name == "blockquote":
             text = self._inline_text(node, base_url)
-            return (["> " + line if line else ">"] + [""]) if text else None
-        if name == "table":
-            html = node.decode()
-            return ["```html", html, "```", ""]
-        # NOTE: images handled in parse(); don't handle here
-        return None
+            if text:
+                yield "> " + text
+                yield ""
+        elif name == "table":
+            yield from ("```html", node.decode(), "```", "")
+        # NOTE: images handled in _page_lines(); don't handle here
 
     def _inline_text(self, tag: Tag, base_url: str) -> str:
+        # code/a are rendered whole, so their children are not walked a second time
         parts = []
-        for el in tag.descendants:
-            if isinstance(el, NavigableString):
+        stack = list(reversed(tag.contents))
+        while stack:
+            el = stack.pop()
+            cls = el.__class__
+            if cls is NavigableString:
                 parts.append(str(el))
-            elif isinstance(el, Tag):
-                nm = el.name.lower()
-                if nm == "code" and (el.parent.name.lower() != "pre"):
+            elif cls is Tag:
+                nm = el.name
+                if nm == "code" and el.parent.name != "pre":
                     parts.append(f"`{el.get_text()}`")
                 elif nm == "a" and el.get("href"):
-                    href = urljoin(base_url, el.get("href").strip())
-                    label = el.get_text(strip=True) or href
+                    href = _urljoin(base_url, el.get("href").strip())
+                    label = " ".join(el.get_text().split()) or href
                     parts.append(f"[{label}]({href})")
+                else:
+                    stack.extend(reversed(el.contents))
         return " ".join("".join(parts).strip().split())
 
-    def _render_list(self, ul_or_ol: Tag, lines: list, depth: int, ordered: bool, base_url: str):
+    def _render_list(self, ul_or_ol: Tag, depth: int, ordered: bool, base_url: str):
         i = 1
         for li in ul_or_ol.find_all("li", recursive=False):
             prefix = f"{i}." if ordered else "-"
             head, tails = [], []
             for c in li.contents:
-                if isinstance(c, NavigableString):
+                cls = c.__class__
+                if cls is NavigableString:
                     head.append(str(c))
-                elif isinstance(c, Tag) and c.name.lower() not in {"ul","ol","pre","p"}:
+                elif cls is Tag and c.name not in _LIST_SKIP:
                     head.append(self._inline_text(c, base_url))
                 else:
                     tails.append(c)
             first_line = " ".join(" ".join(head).split()).strip()
-            lines.append(("  " * depth) + f"{prefix} {first_line}".rstrip())
+            yield ("  " * depth) + f"{prefix} {first_line}".rstrip()
             for t in tails:
-                if isinstance(t, Tag) and t.name.lower() in {"ul","ol"}:
-                    self._render_list(t, lines, depth+1, ordered=(t.name.lower()=="ol"), base_url=base_url)
-                elif isinstance(t, Tag) and t.name.lower() in {"pre","p"}:
-                    if t.name.lower() == "p":
-                        txt = self._inline_text(t, base_url)
-                        if txt:
-                            lines.append(("  " * (depth+1)) + txt)
-                    else:
-                        code = t.get_text().rstrip("\n")
-                        if code:
-                            indent = "  " * (depth+1)
-                            lines.extend([indent + "```", code, indent + "```"])
+                if t.__class__ is not Tag:
+                    continue
+                if t.name in _LIST_TAGS:
+                    yield from self._render_list(t, depth+1, ordered=(t.name == "ol"), base_url=base_url)
+                elif t.name == "p":
+                    txt = self._inline_text(t, base_url)
+                    if txt:
+                        yield ("  " * (depth+1)) + txt
+                else:  # pre
+                    code = t.get_text().rstrip("\n")
+                    if code:
+                        indent = "  " * (depth+1)
+                        yield from (indent + "```", code, indent + "```")
             i += 1
 
     def _save_image_response(self, response):
-        planned = response.meta.get("planned_name")
-        if planned:
-            fname = planned
-        else:
-            parsed = urlparse(response.url)
-            name = os.path.basename(parsed.path) or "image"
-            if "." not in name:
-                ct = response.headers.get(b"Content-Type", b"").decode().lower()
-                name += self._ext_from_ct(ct)
-            root, ext = os.path.splitext(name)
-            digest = hashlib.sha1(response.body[:64]).hexdigest()[:8]
-            fname = f"{self._safe_name(root)}-{digest}{ext or '.bin'}"
-        (self.assets_dir / fname).write_bytes(response.body)
+        # every asset request carries the name its pages' markdown already links to
+        fname = response.meta["planned_name"]
+        # raw fd write: no Path objects or buffered file wrapper per asset
+        fd = os.open(os.path.join(self._assets_path, fname), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            view = memoryview(response.body)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
         self.logger.info(f"Saved asset: {fname}")
 
-    def _planned_asset_name(self, abs_url: str) -> str:
+    @staticmethod
+    @functools.lru_cache(maxsize=8192)  # shared assets (logos, icons) recur on every page
+    def _planned_asset_name(abs_url: str) -> str:
         parsed = urlparse(abs_url)
         base = os.path.basename(parsed.path) or "asset"
         root, ext = os.path.splitext(base)
-        if not ext:
-            ext = ""
-        h = hashlib.sha1(abs_url.encode()).hexdigest()[:8]
-        return f"{self._safe_name(root)}-{h}{ext or ''}"
+        h = hashlib.blake2b(abs_url.encode(), digest_size=4).hexdigest()
+        return f"{DocsCrawler._safe_name(root)}-{h}{ext}"
 
     def _page_slug(self, url: str) -> str:
         parsed = urlparse(url)
@@ -268,25 +424,6 @@ class DocsCrawler(scrapy.Spider):
         return f"assets/{name}"
 
     @staticmethod
-    def _ext_from_ct(ct: str) -> str:
-        if "png" in ct: return ".png"
-        if "jpeg" in ct or "jpg" in ct: return ".jpg"
-        if "gif" in ct: return ".gif"
-        if "webp" in ct: return ".webp"
-        return ".bin"
-
-    @staticmethod
-    def _squash_blank_lines(lines):
-        out, prev_blank = [], False
-        for ln in lines:
-            s = "" if ln is None else str(ln)
-            blank = (s.strip() == "")
-            if blank and prev_blank:
-                continue
-            out.append(s)
-            prev_blank = blank
-        return out
-
-    @staticmethod
+    @functools.lru_cache(maxsize=4096)
     def _safe_name(s: str) -> str:
-        return re.sub(r"[^a-zA-Z0-9._-]+", "-", s)[:80] or "file"
+        return _SAFE_NAME_RE.sub("-", s)[:80] or "file"